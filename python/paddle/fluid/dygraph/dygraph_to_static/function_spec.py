@@ -13,7 +13,6 @@
 # limitations under the License.
 
 import logging
-import six
 import inspect
 import numpy as np
 import collections
@@ -21,7 +20,11 @@ import paddle
 from paddle.fluid import core
 from paddle.fluid.dygraph import layers
 from paddle.fluid.layers.utils import flatten
-from paddle.fluid.layers.utils import pack_sequence_as
+from paddle.fluid.layers.utils import is_sequence
+from paddle.fluid.layers.utils import _sequence_like
+from paddle.fluid.layers.utils import _yield_value
+from paddle.fluid.layers.utils import flatten_with_skeleton
+from paddle.fluid.layers.utils import pack_with_skeleton
 from paddle.fluid.dygraph.base import switch_to_static_graph
 from paddle.fluid.dygraph.dygraph_to_static.utils import parse_arg_and_kwargs
 from paddle.fluid.dygraph.dygraph_to_static.utils import type_name
@@ -33,6 +36,11 @@ class FunctionSpec(object):
     Wrapper class for a function for class method.
     """
 
+    __slots__ = [
+        '_dygraph_function', '_input_spec', '_flat_input_spec', '_arg_names',
+        '_default_kwargs', '_n_args', '_arg_name_set', '_unify_cache'
+    ]
+
     def __init__(self, function, input_spec=None):
         self._dygraph_function = function
         if input_spec is None:
@@ -44,6 +52,11 @@ class FunctionSpec(object):
 
         # parse full argument names list.
         self._arg_names, self._default_kwargs = parse_arg_and_kwargs(function)
+        self._n_args = len(self._arg_names)
+        self._arg_name_set = frozenset(self._arg_names)
+        # cache of fill plans used by `unified_args_and_kwargs`, keyed by
+        # len(args) and names of kwargs that are also argument names.
+        self._unify_cache = {}
 
     def unified_args_and_kwargs(self, args, kwargs):
         """
@@ -63,32 +76,50 @@ class FunctionSpec(object):
         Return:
             New arguments tuple containing default kwargs value.
         """
-        if len(self._arg_names) < len(args):
-            error_msg = "The decorated function `{}` requires {} arguments: {}, but received {} with {}.".format(
-                self._dygraph_function.__name__,
-                len(self._arg_names), self._arg_names, len(args), args)
-            if args and inspect.isclass(args[0]):
-                error_msg += "\n\tMaybe the function has more than one decorator, we don't support this for now."
-                raise NotImplementedError(error_msg)
-            else:
-                raise ValueError(error_msg)
+        if self._n_args < len(args):
+            _raise_too_many_args(self, args)
+
+        # Note: In most cases, all arguments are passed by position.
+        if not kwargs and len(args) == self._n_args:
+            return tuple(args), kwargs
+
+        key = (len(args), frozenset(kwargs))
+        fill_plan = self._unify_cache.get(key)
+        if fill_plan is None:
+            # Note: Extra names received by `**kwargs` don't affect the fill
+            # plan, so exclude them from the stored key to keep cache bounded.
+            key = (len(args), self._arg_name_set.intersection(kwargs))
+            fill_plan = self._unify_cache.get(key)
+            if fill_plan is None:
+                fill_plan = self._make_fill_plan(args, kwargs)
+                self._unify_cache[key] = fill_plan
 
         args = list(args)
+        args.extend([
+            kwargs.pop(arg_name) if from_kwargs else default_value
+            for arg_name, from_kwargs, default_value in fill_plan
+        ])
+
+        return tuple(args), kwargs
 
-        for i in six.moves.range(len(args), len(self._arg_names)):
+    def _make_fill_plan(self, args, kwargs):
+        """
+        Returns a list of `(arg_name, from_kwargs, default_value)` describing
+        how to fill the missing positional arguments, which only depends on
+        `len(args)` and names of `kwargs`.
+        """
+        fill_plan = []
+        for i in range(len(args), self._n_args):
             arg_name = self._arg_names[i]
             if arg_name in kwargs:
-                args.append(kwargs[arg_name])
-                del kwargs[arg_name]
+                fill_plan.append((arg_name, True, None))
             else:
                 if arg_name not in self._default_kwargs:
-                    raise ValueError(
-                        "`{}()` requires `{}` arguments, but not found in input `args`: {} and `kwargs`: {}.".
-                        format(self._dygraph_function.__name__, arg_name, args,
-                               kwargs))
-                args.append(self._default_kwargs[arg_name])
+                    _raise_missing_arg(self, arg_name, args, kwargs)
+                fill_plan.append((arg_name, False,
+                                  self._default_kwargs[arg_name]))
 
-        return tuple(args), kwargs
+        return fill_plan
 
     def args_to_input_spec(self, args, kwargs):
         """
@@ -104,8 +135,6 @@ class FunctionSpec(object):
         Return:
             Same nest structure with args by replacing value with InputSpec.
         """
-        input_with_spec = []
-
         if self._input_spec is not None:
             # Note: Because the value type and length of `kwargs` is uncertain.
             # So we don't support to deal this case while specificing `input_spec` currently.
@@ -123,17 +152,12 @@ class FunctionSpec(object):
                     format(len(args), len(self._input_spec)))
 
             # replace argument with corresponding InputSpec.
+            # Note: The result can't be cached by the structure of `args`, because
+            # arguments without specified InputSpec are kept as their values and
+            # become a part of the CacheKey of program.
             input_with_spec = convert_to_input_spec(args, self._input_spec)
         else:
-            for idx, input_var in enumerate(flatten(args)):
-                if isinstance(input_var, np.ndarray):
-                    input_var = paddle.static.InputSpec.from_numpy(input_var)
-                elif isinstance(input_var, core.VarBase):
-                    input_var = paddle.static.InputSpec.from_tensor(input_var)
-
-                input_with_spec.append(input_var)
-
-            input_with_spec = pack_sequence_as(args, input_with_spec)
+            input_with_spec = _walk_convert(args)
 
         return input_with_spec
 
@@ -146,7 +170,10 @@ class FunctionSpec(object):
             input_with_spec(tuple): input arguments by replacing argument with InputSpec.
             main_program(Program): main program for inserting feed layer.
         """
-        flat_input_spec = flatten(input_with_spec)
+        # Note: Feed layers are created only once for each `main_program`,
+        # because the whole ConcreteProgram is cached by `ProgramCache` with
+        # the same `input_with_spec`. So it's unnecessary to cache them here.
+        flat_input_spec, skeleton = flatten_with_skeleton(input_with_spec)
 
         inputs = []
         block = main_program.global_block()
@@ -163,7 +190,7 @@ class FunctionSpec(object):
                 feed_layer = var_spec
             inputs.append(feed_layer)
 
-        return pack_sequence_as(input_with_spec, inputs)
+        return pack_with_skeleton(skeleton, inputs)
 
     def _verify_input_spec(self, input_spec):
         """
@@ -174,6 +201,11 @@ class FunctionSpec(object):
                 "The type(input_spec) should be one of (tuple, list), but received {}.".
                 format(type_name(input_spec)))
         input_spec = tuple(input_spec)
+        # Note: The most common case is a flat tuple of InputSpec, which
+        # needs no recursive `flatten`.
+        if all(type(spec) is paddle.static.InputSpec for spec in input_spec):
+            return input_spec
+
         for spec in flatten(input_spec):
             if not isinstance(spec, paddle.static.InputSpec):
                 raise ValueError(
@@ -208,6 +240,44 @@ class FunctionSpec(object):
         return func_to_source_code(self._dygraph_function)
 
 
+# Note: Error messages are formatted in the following helpers rather than
+# inline, to keep them out of the frequently called `unified_args_and_kwargs`.
+def _raise_too_many_args(function_spec, args):
+    error_msg = "The decorated function `{}` requires {} arguments: {}, but received {} with {}.".format(
+        function_spec.dygraph_function.__name__,
+        len(function_spec.args_name), function_spec.args_name, len(args), args)
+    if args and inspect.isclass(args[0]):
+        error_msg += "\n\tMaybe the function has more than one decorator, we don't support this for now."
+        raise NotImplementedError(error_msg)
+    else:
+        raise ValueError(error_msg)
+
+
+def _raise_missing_arg(function_spec, arg_name, args, kwargs):
+    raise ValueError(
+        "`{}()` requires `{}` arguments, but not found in input `args`: {} and `kwargs`: {}.".
+        format(function_spec.dygraph_function.__name__, arg_name, args, kwargs))
+
+
+def _walk_convert(obj):
+    """
+    Replaces Tensor and numpy.ndarray in nested structure `obj` by InputSpec.
+    It rebuilds the structure in one recursive walk, which is equivalent to but
+    cheaper than `pack_sequence_as(obj, [convert(x) for x in flatten(obj)])`.
+    """
+    if isinstance(obj, core.VarBase):
+        return paddle.static.InputSpec.from_tensor(obj)
+    elif isinstance(obj, np.ndarray):
+        return paddle.static.InputSpec.from_numpy(obj)
+    elif is_sequence(obj):
+        # Note: `_yield_value` iterates dict in sorted keys order, which is
+        # required by `_sequence_like`.
+        return _sequence_like(obj,
+                              [_walk_convert(x) for x in _yield_value(obj)])
+    else:
+        return obj
+
+
 def get_parameters(layer_instance, include_sublayer=True):
     """
     Returns parameters of decorated layers. If set `include_sublayer` True,
@@ -217,9 +287,11 @@ def get_parameters(layer_instance, include_sublayer=True):
     if layer_instance is not None:
         if isinstance(layer_instance, layers.Layer):
             if include_sublayer:
-                params = layer_instance.parameters()
-                names = [p.name for p in params]
-                params = collections.OrderedDict(zip(names, params))
+                # Note: Don't memoize it by `layer_instance`. It's only called
+                # while building a new ConcreteProgram, and parameters of any
+                # sub layer may be added or replaced between two builds.
+                params = collections.OrderedDict(
+                    (p.name, p) for p in layer_instance.parameters())
             else:
                 params = layer_instance._parameters
         else:
@@ -239,9 +311,9 @@ def get_buffers(layer_instance, include_sublayer=True):
     if layer_instance is not None:
         if isinstance(layer_instance, layers.Layer):
             if include_sublayer:
-                buffers = layer_instance.buffers()
-                names = [buffer.name for buffer in buffers]
-                buffers = collections.OrderedDict(zip(names, buffers))
+                buffers = collections.OrderedDict(
+                    (buffer.name, buffer)
+                    for buffer in layer_instance.buffers())
             else:
                 buffers = layer_instance._buffers
         else:
@@ -251,6 +323,16 @@ def get_buffers(layer_instance, include_sublayer=True):
     return buffers
 
 
+def _check_type_and_len(input, spec, check_length=False):
+    if type(input) is not type(spec):
+        raise TypeError('type(input) should be {}, but received {}.'.format(
+            type(spec), type(input)))
+    if check_length and len(input) < len(spec):
+        raise ValueError(
+            'Requires len(inputs) >= len(input_spec), but received len(inputs):{} < len(input_spec):{}'.
+            format(len(input), len(spec)))
+
+
 def convert_to_input_spec(inputs, input_spec):
     """
     Replaces tensor in structured `inputs` by InputSpec in `input_spec`.
@@ -263,49 +345,86 @@ def convert_to_input_spec(inputs, input_spec):
     Return:
         Same structure with inputs by replacing the element with specified InputSpec.
     """
-
-    def check_type_and_len(input, spec, check_length=False):
-        if type(input) is not type(spec):
-            raise TypeError('type(input) should be {}, but received {}.'.format(
-                type(spec), type(input)))
-        if check_length and len(input) < len(spec):
-            raise ValueError(
-                'Requires len(inputs) >= len(input_spec), but received len(inputs):{} < len(input_spec):{}'.
-                format(len(inputs), len(input_spec)))
-
-    if isinstance(input_spec, (tuple, list)):
-        input_with_spec = []
-        check_type_and_len(inputs, input_spec, True)
-
-        for i, spec in enumerate(input_spec):
-            out_spec = convert_to_input_spec(inputs[i], spec)
-            input_with_spec.append(out_spec)
-
-        # Note: If the rest inputs contain tensor or numpy.ndarray
-        # without specific InputSpec, raise warning.
-        if len(inputs) > len(input_spec):
-            for rest_input in inputs[len(input_spec):]:
-                if isinstance(rest_input, (core.VarBase, np.ndarray)):
-                    logging.warning(
-                        "The inputs constain `{}` without specificing InputSpec, its shape and dtype will be treated immutable. "
-                        "Please specific InputSpec information in `@declarative` if you expect them as mutable inputs.".
-                        format(type_name(rest_input)))
-        input_with_spec.extend(inputs[len(input_spec):])
-
-        return input_with_spec
-    elif isinstance(input_spec, dict):
-        input_with_spec = {}
-        check_type_and_len(inputs, input_spec, True)
-        for name, input in six.iteritems(inputs):
-            if name in input_spec:
-                input_with_spec[name] = convert_to_input_spec(input,
-                                                              input_spec[name])
-            else:
-                input_with_spec[name] = input
-        return input_with_spec
-    elif isinstance(input_spec, paddle.static.InputSpec):
+    # Note: InputSpec is the most frequent node in nested `input_spec`, so check
+    # its exact type first to terminate the recursion as early as possible.
+    spec_type = type(input_spec)
+    if spec_type is paddle.static.InputSpec:
         return input_spec
-    else:
+
+    handler = _input_spec_handlers.get(spec_type)
+    if handler is None:
+        handler = _resolve_input_spec_handler(spec_type)
+    if handler is None:
         raise TypeError(
             "The type(input_spec) should be a `InputSpec` or dict/list/tuple of it, but received {}.".
-            type_name(input_spec))
+            format(type_name(input_spec)))
+    return handler(inputs, input_spec)
+
+
+def _convert_sequence_to_input_spec(inputs, input_spec):
+    input_with_spec = []
+    _check_type_and_len(inputs, input_spec, True)
+
+    for i, spec in enumerate(input_spec):
+        out_spec = convert_to_input_spec(inputs[i], spec)
+        input_with_spec.append(out_spec)
+
+    # Note: If the rest inputs contain tensor or numpy.ndarray
+    # without specific InputSpec, raise warning.
+    if len(inputs) > len(input_spec):
+        for rest_input in inputs[len(input_spec):]:
+            if isinstance(rest_input, (core.VarBase, np.ndarray)):
+                logging.warning(
+                    "The inputs constain `{}` without specificing InputSpec, its shape and dtype will be treated immutable. "
+                    "Please specific InputSpec information in `@declarative` if you expect them as mutable inputs.".
+                    format(type_name(rest_input)))
+    input_with_spec.extend(inputs[len(input_spec):])
+
+    return input_with_spec
+
+
+def _convert_dict_to_input_spec(inputs, input_spec):
+    input_with_spec = {}
+    _check_type_and_len(inputs, input_spec, True)
+    for name, input in inputs.items():
+        if name in input_spec:
+            input_with_spec[name] = convert_to_input_spec(
+                input, input_spec[name])
+        else:
+            input_with_spec[name] = input
+    return input_with_spec
+
+
+def _return_input_spec(inputs, input_spec):
+    return input_spec
+
+
+# Maps type(input_spec) into the handler of `convert_to_input_spec`, so that
+# the dominant container types are dispatched by one dict lookup instead of a
+# cascade of `isinstance` checks. Subclasses are added lazily by
+# `_resolve_input_spec_handler`.
+_input_spec_handlers = {
+    tuple: _convert_sequence_to_input_spec,
+    list: _convert_sequence_to_input_spec,
+    dict: _convert_dict_to_input_spec,
+}
+
+
+def _resolve_input_spec_handler(spec_type):
+    """
+    Resolves the handler for a `spec_type` missing in `_input_spec_handlers` by
+    `issubclass` and caches it. Returns None if `spec_type` is not supported.
+
+    Note: `paddle.static.InputSpec` can't be registered at import time, because
+    it's not importable while loading this module.
+    """
+    if issubclass(spec_type, paddle.static.InputSpec):
+        handler = _return_input_spec
+    elif issubclass(spec_type, (tuple, list)):
+        handler = _convert_sequence_to_input_spec
+    elif issubclass(spec_type, dict):
+        handler = _convert_dict_to_input_spec
+    else:
+        return None
+    _input_spec_handlers[spec_type] = handler
+    return handler
@@ -186,6 +186,60 @@ def pack_sequence_as(structure, flat_sequence):
     return _sequence_like(structure, packed)
 
 
+def _flatten_with_skeleton(nest, flat):
+    """
+    Helper function for flatten_with_skeleton.
+    """
+    if not is_sequence(nest):
+        flat.append(nest)
+        return None
+    return nest, [_flatten_with_skeleton(n, flat) for n in _yield_value(nest)]
+
+
+def flatten_with_skeleton(structure):
+    """
+    Flattens `structure` like `flatten` and also returns its skeleton, which
+    can be used by `pack_with_skeleton` to pack a flat sequence into the same
+    structure without traversing `structure` again like `pack_sequence_as`.
+
+    The skeleton of an entry is None, and the skeleton of a nested structure is
+    a tuple of the structure itself and the list of its children's skeleton.
+    """
+    flat = []
+    skeleton = _flatten_with_skeleton(structure, flat)
+    return flat, skeleton
+
+
+def _packed_nest_with_skeleton(skeleton, flat_iter):
+    """
+    Helper function for pack_with_skeleton.
+    """
+    if skeleton is None:
+        return next(flat_iter)
+    structure, children = skeleton
+    packed = [_packed_nest_with_skeleton(s, flat_iter) for s in children]
+    return _sequence_like(structure, packed)
+
+
+def pack_with_skeleton(skeleton, flat_sequence):
+    """
+    Pack a given flattened sequence into the structure described by `skeleton`
+    returned from `flatten_with_skeleton`.
+    """
+    flat_iter = iter(flat_sequence)
+    try:
+        packed = _packed_nest_with_skeleton(skeleton, flat_iter)
+    except StopIteration:
+        raise ValueError(
+            "Could not pack sequence. flat_sequence has less elements than "
+            "skeleton, flat_sequence: %s." % (flat_sequence, ))
+    if any(True for _ in flat_iter):
+        raise ValueError(
+            "Could not pack sequence. flat_sequence has more elements than "
+            "skeleton, flat_sequence: %s." % (flat_sequence, ))
+    return packed
+
+
 def map_structure(func, *structure):
     """
     Apply `func` to each entry in `structure` and return a new structure.
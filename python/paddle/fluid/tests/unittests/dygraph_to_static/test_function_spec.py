@@ -12,9 +12,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
+import numpy as np
 import paddle
 from paddle.static import InputSpec
 from paddle.fluid.dygraph.dygraph_to_static.function_spec import FunctionSpec
+from paddle.fluid.dygraph.dygraph_to_static.function_spec import convert_to_input_spec
 
 from test_declarative import foo_func
 
@@ -64,6 +67,19 @@ class TestFunctionSpec(unittest.TestCase):
         self.assertTupleEqual(args, (10, 20, 1, 2))
         self.assertTrue(len(kwargs) == 0)
 
+        # case 4: foo(10, b=30), hits the cached fill plan of case 3
+        cache_size = len(foo_spec._unify_cache)
+        args, kwargs = foo_spec.unified_args_and_kwargs([10], {'b': 30})
+        self.assertTupleEqual(args, (10, 30, 1, 2))
+        self.assertTrue(len(kwargs) == 0)
+        self.assertEqual(len(foo_spec._unify_cache), cache_size)
+
+        # case 5: foo(10, b=20, e=5), extra kwargs don't add cache entry
+        args, kwargs = foo_spec.unified_args_and_kwargs([10], {'b': 20, 'e': 5})
+        self.assertTupleEqual(args, (10, 20, 1, 2))
+        self.assertDictEqual(kwargs, {'e': 5})
+        self.assertEqual(len(foo_spec._unify_cache), cache_size)
+
         # assert len(self._arg_names) >= len(args)
         with self.assertRaises(ValueError):
             foo_spec.unified_args_and_kwargs([10, 20, 30, 40, 50], {'c': 4})
@@ -111,6 +127,53 @@ class TestFunctionSpec(unittest.TestCase):
         with self.assertRaises(ValueError):
             input_with_spec = foo_spec.args_to_input_spec((a_tensor, ), {})
 
+    def test_args_to_input_spec_with_nested_args(self):
+        Pair = collections.namedtuple('Pair', ['x', 'y'])
+        x_data = np.ones([2, 3]).astype('float32')
+        y_data = np.ones([4]).astype('float32')
+        args = ([x_data, {'b': y_data, 'a': 1}], Pair(x=x_data, y=2))
+
+        foo_spec = FunctionSpec(foo_func)
+        input_with_spec = foo_spec.args_to_input_spec(args, {})
+        self.assertTrue(type(input_with_spec) is tuple)
+
+        x_list, pair = input_with_spec
+        self.assertTrue(isinstance(x_list[0], InputSpec))
+        self.assertTupleEqual(x_list[0].shape, (2, 3))
+        self.assertListEqual(list(x_list[1].keys()), ['b', 'a'])
+        self.assertTupleEqual(x_list[1]['b'].shape, (4, ))
+        self.assertEqual(x_list[1]['a'], 1)
+        self.assertTrue(type(pair) is Pair)
+        self.assertTupleEqual(pair.x.shape, (2, 3))
+        self.assertEqual(pair.y, 2)
+
+    def test_convert_to_input_spec_with_invalid_spec(self):
+        # type(input_spec) should be InputSpec or dict/list/tuple of it
+        with self.assertRaises(TypeError):
+            convert_to_input_spec((1, ), (5, ))
+
+    def test_convert_to_input_spec_with_subclass(self):
+        a_spec = InputSpec([None, 10], name='a')
+        Pair = collections.namedtuple('Pair', ['x', 'y'])
+
+        # namedtuple is dispatched as a sequence
+        input_with_spec = convert_to_input_spec(
+            Pair(x=1, y=2), Pair(x=a_spec, y=a_spec))
+        self.assertListEqual(input_with_spec, [a_spec, a_spec])
+
+        # subclass of InputSpec is kept as leaf
+        class SubInputSpec(InputSpec):
+            pass
+
+        sub_spec = SubInputSpec([10], name='sub')
+        input_with_spec = convert_to_input_spec([1, 2], [sub_spec])
+        self.assertTrue(input_with_spec[0] is sub_spec)
+        self.assertTrue(input_with_spec[1] == 2)
+
+        # unsupported type of input_spec
+        with self.assertRaises(TypeError):
+            convert_to_input_spec([1], [set([1])])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,59 @@
+# Copyright (c) 2020 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+import collections
+import unittest
+
+from paddle.fluid.layers.utils import flatten
+from paddle.fluid.layers.utils import pack_sequence_as
+from paddle.fluid.layers.utils import flatten_with_skeleton
+from paddle.fluid.layers.utils import pack_with_skeleton
+
+Point = collections.namedtuple('Point', ['x', 'y'])
+
+
+class TestNestWithSkeleton(unittest.TestCase):
+    def setUp(self):
+        self.structures = [
+            1,
+            [1, 2, 3],
+            dict(b=1, a=2, c=[3, 4]),
+            collections.OrderedDict([('z', 1), ('a', (2, 3))]),
+            Point(x=1, y=[2, dict(k=3)]),
+            (1, [2, (3, Point(4, 5))], dict(d=dict(e=6), f=[])),
+        ]
+
+    def test_same_as_flatten_and_pack(self):
+        for structure in self.structures:
+            flat, skeleton = flatten_with_skeleton(structure)
+            self.assertListEqual(flat, flatten(structure))
+
+            new_flat = [str(x) for x in flat]
+            packed = pack_with_skeleton(skeleton, new_flat)
+            expected = pack_sequence_as(structure, new_flat)
+            self.assertEqual(packed, expected)
+            self.assertIs(type(packed), type(expected))
+
+    def test_wrong_length(self):
+        flat, skeleton = flatten_with_skeleton([1, (2, 3)])
+        with self.assertRaises(ValueError):
+            pack_with_skeleton(skeleton, flat[:-1])
+        with self.assertRaises(ValueError):
+            pack_with_skeleton(skeleton, flat + [4])
+
+
+if __name__ == '__main__':
+    unittest.main()